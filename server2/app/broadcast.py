@@ -0,0 +1,185 @@
+"""Push the session API key to every connected client."""
+
+import asyncio
+import logging
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from contextlib import asynccontextmanager, suppress
+
+from pydantic import BaseModel
+
+from app import db
+from app.models import OpenRouterSession
+
+_ROTATE_BEFORE_EXPIRATION_SECONDS = 20
+_RETRY_DELAY_SECONDS = 5
+_MAX_RETRY_DELAY_SECONDS = 5 * 60  # 5 minutes
+# Failed fetches in a row before the subscribers are told the key is unavailable
+_MAX_FAILED_FETCHES = 3
+# The key may be revoked by another worker
+_CHECK_REVOKED_EVERY_SECONDS = 30
+
+
+class SessionError(BaseModel):
+    detail: str
+
+
+type SessionEvent = OpenRouterSession | SessionError | None
+
+
+class SessionBroadcaster:
+    """Share one session key between all the subscribers.
+
+    A single task fetches the session key and pushes it to every subscriber, then
+    fetches the next one shortly before the clients must stop using it, or as soon as
+    the key is revoked. The task only runs while there is at least one subscriber.
+
+    Each subscriber owns a queue holding at most one session: a slow client only
+    ever receives the latest key, so its memory footprint stays bounded. A
+    ``SessionError`` is sent to the subscribers when the key can't be fetched, and
+    ``None`` once the broadcaster is closed.
+
+    The failed fetches are retried with an exponential backoff.
+    """
+
+    def __init__(
+        self,
+        fetch_session: Callable[[], Awaitable[OpenRouterSession]],
+        logger: logging.Logger,
+    ) -> None:
+        self._fetch_session = fetch_session
+        self._logger = logger
+        self._subscribers: set[asyncio.Queue[SessionEvent]] = set()
+        self._current: OpenRouterSession | None = None
+        self._published_at = 0.0
+        self._task: asyncio.Task[None] | None = None
+        self._is_closed = False
+        self._failed_fetches = 0
+        self._retry_at = 0.0
+
+    @asynccontextmanager
+    async def subscribe(self) -> AsyncGenerator[asyncio.Queue[SessionEvent]]:
+        queue: asyncio.Queue[SessionEvent] = asyncio.Queue(maxsize=1)
+        if self._is_closed:
+            queue.put_nowait(None)
+        elif self._is_unavailable():
+            queue.put_nowait(_UNAVAILABLE)
+        else:
+            current = await self.current_session()
+            if current is not None:
+                queue.put_nowait(current)
+        self._subscribers.add(queue)
+        if not self._is_closed and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._rotate())
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
+            if not self._subscribers:
+                await self.stop()
+
+    async def stop(self) -> None:
+        self._current = None
+        await self._cancel_task()
+
+    def close(self) -> None:
+        """End all the subscriptions, e.g. when the server is shutting down."""
+        self._is_closed = True
+        self._current = None
+        if self._task is not None:
+            self._task.cancel()
+        for queue in self._subscribers:
+            _put_latest(queue, None)
+
+    async def revoke(self, api_hash: str) -> None:
+        """Stop sharing the given key and push a new one to the subscribers."""
+        if self._current is None or self._current.hash != api_hash:
+            return
+        self._current = None
+        await self._cancel_task()
+        if self._subscribers and self._task is None and not self._is_closed:
+            self._task = asyncio.create_task(self._rotate())
+
+    async def _cancel_task(self) -> None:
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+    async def current_session(self) -> OpenRouterSession | None:
+        """Get the last published session with a max age relative to now."""
+        if self._current is None:
+            return None
+        if await db.is_key_revoked(self._current.hash):
+            self._current = None
+            return None
+        elapsed = asyncio.get_running_loop().time() - self._published_at
+        max_age = self._current.max_age - elapsed
+        if max_age <= _ROTATE_BEFORE_EXPIRATION_SECONDS:
+            return None
+        return self._current.model_copy(update={"max_age": max_age})
+
+    def _is_unavailable(self) -> bool:
+        """Check if the last fetches failed and the next one isn't due yet."""
+        return (
+            self._failed_fetches >= _MAX_FAILED_FETCHES
+            and asyncio.get_running_loop().time() < self._retry_at
+        )
+
+    def _fail_fetch(self) -> None:
+        self._failed_fetches += 1
+        delay = min(
+            _RETRY_DELAY_SECONDS * 2 ** (self._failed_fetches - 1), _MAX_RETRY_DELAY_SECONDS
+        )
+        self._retry_at = asyncio.get_running_loop().time() + delay
+        if self._failed_fetches >= _MAX_FAILED_FETCHES:
+            self._current = None
+            for queue in self._subscribers:
+                _put_latest(queue, _UNAVAILABLE)
+
+    def _publish(self, session: OpenRouterSession) -> None:
+        self._current = session
+        self._published_at = asyncio.get_running_loop().time()
+        for queue in self._subscribers:
+            _put_latest(queue, session)
+
+    async def _rotate(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # The backoff outlives the task so new subscribers don't reset it
+            await asyncio.sleep(max(self._retry_at - loop.time(), 0))
+            try:
+                # Don't abandon a key being created if the last subscriber leaves
+                session = await asyncio.shield(self._fetch_session())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._logger.exception("Failed to fetch the session key to broadcast")
+                self._fail_fetch()
+                continue
+            self._failed_fetches = 0
+            self._publish(session)
+            await self._wait_rotation(session)
+
+    async def _wait_rotation(self, session: OpenRouterSession) -> None:
+        """Wait until the session must be rotated or its key has been revoked."""
+        loop = asyncio.get_running_loop()
+        rotate_at = loop.time() + max(
+            session.max_age - _ROTATE_BEFORE_EXPIRATION_SECONDS, _RETRY_DELAY_SECONDS
+        )
+        while (delay := rotate_at - loop.time()) > 0:
+            await asyncio.sleep(min(delay, _CHECK_REVOKED_EVERY_SECONDS))
+            if await db.is_key_revoked(session.hash):
+                self._logger.info("Rotate the revoked session key: %s", session.hash)
+                self._current = None
+                return
+
+
+_UNAVAILABLE = SessionError(detail="Failed to retrieve the API key.")
+
+
+def _put_latest(queue: asyncio.Queue[SessionEvent], event: SessionEvent) -> None:
+    """Put the event in the queue, replacing the one not consumed yet."""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
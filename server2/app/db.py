@@ -21,6 +21,61 @@ async def create_db_and_tables() -> None:
             )
             """
         )
+        await conn.execute(
+            """--sql
+            CREATE TABLE IF NOT EXISTS app_lock(
+                name TEXT PRIMARY KEY NOT NULL,
+                owner TEXT NOT NULL,
+                locked_until REAL NOT NULL
+            )
+            """
+        )
+        await conn.execute(
+            """--sql
+            CREATE TABLE IF NOT EXISTS revoked_key(
+                api_hash TEXT PRIMARY KEY NOT NULL,
+                revoked_at REAL NOT NULL
+            )
+            """
+        )
+        await conn.commit()
+
+
+async def acquire_lock(name: str, owner: str, duration: float) -> bool:
+    """Try to take the lock shared by all the processes.
+
+    The lock is released after ``duration`` seconds if its owner didn't release it.
+    """
+    current_date = datetime.datetime.now(tz=datetime.UTC).timestamp()
+    async with aiosqlite.connect(DB_PATH) as conn:
+        cursor = await conn.execute(
+            """--sql
+            INSERT INTO app_lock(name, owner, locked_until)
+            VALUES(:name, :owner, :locked_until)
+            ON CONFLICT(name) DO UPDATE
+            SET owner = excluded.owner, locked_until = excluded.locked_until
+            WHERE locked_until <= :current_date
+            """,
+            {
+                "name": name,
+                "owner": owner,
+                "locked_until": current_date + duration,
+                "current_date": current_date,
+            },
+        )
+        await conn.commit()
+        return cursor.rowcount == 1
+
+
+async def release_lock(name: str, owner: str) -> None:
+    async with aiosqlite.connect(DB_PATH) as conn:
+        await conn.execute(
+            """--sql
+            DELETE FROM app_lock
+            WHERE name = :name AND owner = :owner
+            """,
+            {"name": name, "owner": owner},
+        )
         await conn.commit()
 
 
@@ -34,6 +89,8 @@ async def get_available_key(
             SELECT api_key, api_hash, expire_at
             FROM openrouter_key
             WHERE expire_at > :current_date
+                AND api_hash NOT IN (SELECT api_hash FROM revoked_key)
+            ORDER BY expire_at DESC
             LIMIT 1
             """,
             {"current_date": current_date},
@@ -108,9 +165,45 @@ async def delete_key(api_hash: str) -> None:
             """,
             {"api_hash": api_hash},
         )
+        await conn.execute(
+            """--sql
+            DELETE FROM revoked_key
+            WHERE api_hash = :api_hash
+            """,
+            {"api_hash": api_hash},
+        )
         await conn.commit()
 
 
+async def revoke_key(api_hash: str) -> None:
+    """Mark the key as revoked so no worker shares it anymore."""
+    async with aiosqlite.connect(DB_PATH) as conn:
+        await conn.execute(
+            """--sql
+            INSERT OR IGNORE INTO revoked_key(api_hash, revoked_at)
+            VALUES(:api_hash, :revoked_at)
+            """,
+            {
+                "api_hash": api_hash,
+                "revoked_at": datetime.datetime.now(tz=datetime.UTC).timestamp(),
+            },
+        )
+        await conn.commit()
+
+
+async def is_key_revoked(api_hash: str) -> bool:
+    async with aiosqlite.connect(DB_PATH) as conn:
+        cursor = await conn.execute(
+            """--sql
+            SELECT 1
+            FROM revoked_key
+            WHERE api_hash = :api_hash
+            """,
+            {"api_hash": api_hash},
+        )
+        return await cursor.fetchone() is not None
+
+
 async def get_current_keys() -> list[tuple[str, datetime.datetime]]:
     async with (
         aiosqlite.connect(DB_PATH) as conn,
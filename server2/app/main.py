@@ -1,20 +1,24 @@
 import asyncio
 import datetime
+import functools
 import logging
+import signal
 import sys
+import threading
 import uuid
 from collections.abc import AsyncGenerator, Awaitable, Callable
 from contextlib import asynccontextmanager
+from types import FrameType
 from typing import Any
 
 import httpx
 import uvicorn
 from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from httpx import AsyncClient
 
-from app import db, encrypt, expire, tokenutils
+from app import broadcast, db, encrypt, expire, tokenutils
 from app.models import (
     OpenRouterExpense,
     OpenRouterSession,
@@ -33,15 +37,49 @@ if _SETTINGS.dev_mode:
 else:
     _LOGGER.setLevel(logging.INFO)
 
+_KEEP_ALIVE_SECONDS = 30
+_GRACEFUL_SHUTDOWN_TIMEOUT_SECONDS = 10
+# Covers the key creation: the database check and the OpenRouter request. The lock
+# expires so a worker dying while creating a key doesn't block the others.
+_SESSION_LOCK_DURATION_SECONDS = 60
+_SESSION_LOCK_RETRY_SECONDS = 0.2
+
 
 client: AsyncClient | None = None
 
 
+def _handle_exit(
+    loop: asyncio.AbstractEventLoop,
+    previous_handler: Callable[[int, FrameType | None], Any],
+    signum: int,
+    frame: FrameType | None,
+) -> None:
+    loop.call_soon_threadsafe(_SESSION_BROADCASTER.close)
+    previous_handler(signum, frame)
+
+
+def _close_streams_on_exit() -> None:
+    """End the session streams as soon as the server is asked to exit.
+
+    Uvicorn waits for the running responses to complete before the lifespan shutdown,
+    so the streams must be ended from its exit signal handlers.
+    """
+    # Signals can only be listened to from the main thread.
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous_handler = signal.getsignal(sig)
+        if callable(previous_handler):
+            signal.signal(sig, functools.partial(_handle_exit, loop, previous_handler))
+
+
 @asynccontextmanager
 async def lifespan(_: FastAPI) -> AsyncGenerator[None]:
     global client  # noqa: PLW0603
     client = AsyncClient(timeout=20)
     await db.create_db_and_tables()
+    _close_streams_on_exit()
     await expire.remove_all_keys(
         _SETTINGS.openrouter_base_url,
         _SETTINGS.openrouter_prov_api_key.get_secret_value(),
@@ -52,6 +90,7 @@ async def lifespan(_: FastAPI) -> AsyncGenerator[None]:
         yield
     finally:
         try:
+            await _SESSION_BROADCASTER.stop()
             _LOGGER.info("Remove all the keys in the database")
             await expire.remove_all_keys(
                 _SETTINGS.openrouter_base_url,
@@ -169,20 +208,102 @@ async def remove_session_key(api_hash: str, delay: int) -> None:
         )
 
 
-@app.get("/api/v1/openrouter/session")
-async def get_session_key(background_tasks: BackgroundTasks) -> OpenRouterSession:
+_SESSION_LOCK = asyncio.Lock()
+
+
+@asynccontextmanager
+async def _session_lock() -> AsyncGenerator[None]:
+    """Serialize the creation of the session key between the workers."""
+    owner = str(uuid.uuid4())
+    async with _SESSION_LOCK:
+        while True:
+            if await db.acquire_lock(
+                "openrouter_session", owner, _SESSION_LOCK_DURATION_SECONDS
+            ):
+                break
+            await asyncio.sleep(_SESSION_LOCK_RETRY_SECONDS)
+        try:
+            yield
+        finally:
+            await db.release_lock("openrouter_session", owner)
+
+
+async def _get_session() -> tuple[OpenRouterSession, int | None]:
+    """Get the session key, creating a new one if none is available.
+
+    Return the session and, if the key has been created, the delay in seconds before
+    its removal.
+    """
     is_new_key = False
     api_key, api_hash, expire_at = await db.get_available_key()
     delay_session = expire.compute_max_age_session(api_key, expire_at)
     if api_key is None or delay_session is None:
-        is_new_key = True
-        api_key, api_hash, expire_at = await _get_openrouter_api_key()
-        delay_session = expire.compute_max_age_session(api_key, expire_at)
+        async with _session_lock():
+            # Another worker may have created a key while waiting for the lock
+            api_key, api_hash, expire_at = await db.get_available_key()
+            delay_session = expire.compute_max_age_session(api_key, expire_at)
+            if api_key is None or delay_session is None:
+                is_new_key = True
+                api_key, api_hash, expire_at = await _get_openrouter_api_key()
+                delay_session = expire.compute_max_age_session(api_key, expire_at)
     if api_key is None or api_hash is None or delay_session is None:
         raise HTTPException(500, "Failed to retrieve the API key.")
-    if is_new_key:
-        background_tasks.add_task(remove_session_key, api_hash, delay_session.expire)
-    return OpenRouterSession(key=api_key, hash=api_hash, max_age=delay_session.max_age)
+    session = OpenRouterSession(key=api_key, hash=api_hash, max_age=delay_session.max_age)
+    return session, delay_session.expire if is_new_key else None
+
+
+_REMOVE_SESSION_KEY_TASKS: set[asyncio.Task[None]] = set()
+
+
+async def _get_broadcast_session() -> OpenRouterSession:
+    session, remove_delay = await _get_session()
+    if remove_delay is not None:
+        task = asyncio.create_task(remove_session_key(session.hash, remove_delay))
+        _REMOVE_SESSION_KEY_TASKS.add(task)
+        task.add_done_callback(_REMOVE_SESSION_KEY_TASKS.discard)
+    return session
+
+
+_SESSION_BROADCASTER = broadcast.SessionBroadcaster(_get_broadcast_session, _LOGGER)
+
+
+@app.get("/api/v1/openrouter/session")
+async def get_session_key(background_tasks: BackgroundTasks) -> OpenRouterSession:
+    # Share the key pushed to the subscribers instead of creating another one
+    session = await _SESSION_BROADCASTER.current_session()
+    if session is not None:
+        return session
+    session, remove_delay = await _get_session()
+    if remove_delay is not None:
+        background_tasks.add_task(remove_session_key, session.hash, remove_delay)
+    return session
+
+
+@app.get("/api/v1/openrouter/session/stream")
+async def stream_session_key() -> StreamingResponse:
+    """Push the session key to the client each time it is rotated (server-sent events)."""
+
+    async def events() -> AsyncGenerator[str]:
+        async with _SESSION_BROADCASTER.subscribe() as queue:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), _KEEP_ALIVE_SECONDS)
+                except TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    # The server is shutting down
+                    return
+                if isinstance(event, broadcast.SessionError):
+                    yield f"event: error\ndata: {event.model_dump_json()}\n\n"
+                    return
+                yield f"event: session\ndata: {event.model_dump_json()}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.delete("/api/v1/openrouter/session/{api_hash}", status_code=204)
@@ -190,6 +311,8 @@ async def delete_session_key(api_hash: str) -> None:
     if client is None:
         _LOGGER.error("The httpx client is not available. Can't delete the api key.")
         raise HTTPException(status_code=500, detail="Can't delete the api key")
+    # Stop sharing the key in all the workers, even if OpenRouter fails to delete it
+    await db.revoke_key(api_hash)
     try:
         await expire.remove_key(
             api_hash,
@@ -200,6 +323,8 @@ async def delete_session_key(api_hash: str) -> None:
         )
     except Exception:
         _LOGGER.exception("Failed to remove the key: %s", api_hash)
+    # The key may be the one shared by the subscribers
+    await _SESSION_BROADCASTER.revoke(api_hash)
 
 
 @app.get("/api/v1/openrouter/expense")
@@ -233,4 +358,5 @@ if __name__ == "__main__":
         port=_SETTINGS.port,
         log_level=log_level,
         reload=_SETTINGS.dev_mode,
+        timeout_graceful_shutdown=_GRACEFUL_SHUTDOWN_TIMEOUT_SECONDS,
     )
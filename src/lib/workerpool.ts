@@ -13,6 +13,20 @@ interface WorkerState {
     isActive: boolean;
 }
 
+interface APIKey {
+    key: string;
+    hash: string;
+    max_age: number;
+}
+
+type APIKeyMessage =
+    | { type: "request" }
+    | { type: "key", payload: APIKey }
+    | { type: "error", message: string };
+
+const API_KEY_CHANNEL = "amchich-api-key";
+const API_KEY_STREAM_LOCK = "amchich-api-key-stream";
+
 
 export class WorkerPool {
     private workers: WorkerState[] = [];
@@ -23,9 +37,10 @@ export class WorkerPool {
     private maxTokens = 8000;
     private encryptedApiKey: string | undefined;
     private apiKey: string | undefined;
-    private apiHash: string | undefined;
     private maxRetries: number = 3;
-    private apiKeyTimeoutId: NodeJS.Timeout | undefined;
+    private apiKeyTimeout = 30 * 1000;
+    private apiKeyStream: AbortController | undefined;
+    private apiKeyRequest: Promise<void> | undefined;
 
     public constructor(capacity: number) {
         this.capacity = capacity;
@@ -197,13 +212,17 @@ export class WorkerPool {
     }
 
     private async fetchAndStoreAPIKey(): Promise<void> {
+        // Concurrent streamings share the same subscription
+        this.apiKeyRequest ??= this.subscribeAPIKeyWithRetries().finally(() => {
+            this.apiKeyRequest = undefined;
+        });
+        await this.apiKeyRequest;
+    }
+
+    private async subscribeAPIKeyWithRetries(): Promise<void> {
         for (let attempt = 1; attempt <= this.maxRetries; attempt++) {
             try {
-                const data = await this.fetchAPIKey();
-                this.encryptedApiKey = data.key;
-                this.apiHash = data.hash;
-                // Try to fetch a new key a few seconds before it expires
-                this.apiKeyTimeoutId = setTimeout(this.fetchAndStoreAPIKey, (data.max_age - 20) * 1000);
+                await this.subscribeAPIKey();
                 return;
             } catch (error: unknown) {
                 if (attempt === this.maxRetries || (error instanceof Error && error.message.includes("Invalid API"))) {
@@ -214,43 +233,140 @@ export class WorkerPool {
         }
     }
 
-    private async fetchAPIKey(): Promise<{ key: string, hash: string, max_age: number }> {
-        const token = await getToken();
-        const response = await fetch(`${import.meta.env.VITE_BACKEND_URL}/api/v1/openrouter/session`, {
-            method: "GET",
-            headers: {
-                "Content-Type": "application/json",
-                Authorization: `Bearer ${token}`,
-            },
-        });
-        if (!response.ok) throw new Error(`HTTP ${response.status}: ${response.statusText}`);
-        const data = await response.json();
+    private parseAPIKey(data: { key?: string, hash?: string, max_age?: unknown }): APIKey {
         if (!data.key || !data.hash || !data.max_age || typeof data.max_age !== "number") {
             throw new Error("Invalid API");
         }
-        return data;
+        return { key: data.key, hash: data.hash, max_age: data.max_age };
     }
 
-    private async fetchRemoveAPIKey(): Promise<void> {
-        if (this.apiHash !== undefined) {
-            const token = await getToken();
-            const response = await fetch(`${import.meta.env.VITE_BACKEND_URL}/api/v1/openrouter/session/${this.apiHash}`, {
-                method: "DELETE",
-                headers: {
-                    "Content-Type": "application/json",
-                    Authorization: `Bearer ${token}`,
-                },
+    private storeAPIKey(data: { key: string }): void {
+        this.encryptedApiKey = data.key;
+        // Decrypted lazily on the next streaming
+        this.apiKey = undefined;
+    }
+
+    /**
+     * Subscribe to the keys pushed by the server.
+     * The server sends the current key on connection, then the next one a few seconds
+     * before the current one expires. Browsers only allow a few HTTP/1.1 connections per
+     * origin, so only the tab holding the lock streams the keys and shares them with the
+     * other tabs. Another tab takes over once the lock is released.
+     * Resolve once the first key has been received.
+     */
+    private subscribeAPIKey(): Promise<void> {
+        this.apiKeyStream?.abort();
+        const controller = new AbortController();
+        this.apiKeyStream = controller;
+        const channel = new BroadcastChannel(API_KEY_CHANNEL);
+        return new Promise((resolve, reject) => {
+            let hasKey = false;
+            let streamedKey: APIKey | undefined;
+            const fail = (error: unknown) => {
+                reject(error);
+                controller.abort();
+            };
+            const timeoutId = setTimeout(() => {
+                fail(new Error("Timed out waiting for an API key"));
+            }, this.apiKeyTimeout);
+            const onKey = (data: APIKey) => {
+                clearTimeout(timeoutId);
+                this.storeAPIKey(data);
+                hasKey = true;
+                resolve();
+            };
+            channel.onmessage = (event: MessageEvent<APIKeyMessage>) => {
+                const message = event.data;
+                if (message.type === "request") {
+                    if (streamedKey !== undefined) channel.postMessage({ type: "key", payload: streamedKey });
+                } else if (message.type === "key") {
+                    onKey(message.payload);
+                } else if (!hasKey) {
+                    fail(new Error(message.message));
+                }
+            };
+            // Ask the tab streaming the keys for the current one
+            channel.postMessage({ type: "request" });
+            const streamKeys = () => this.readAPIKeyStream(controller.signal, (data) => {
+                streamedKey = data;
+                channel.postMessage({ type: "key", payload: data });
+                onKey(data);
+            }).catch((error: unknown) => {
+                // The other tabs waiting for their first key fail too
+                if (!controller.signal.aborted) {
+                    const message = error instanceof Error ? error.message : String(error);
+                    channel.postMessage({ type: "error", message });
+                }
+                throw error;
             });
-            if (!response.ok) throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+            const streaming = "locks" in navigator
+                ? navigator.locks.request(API_KEY_STREAM_LOCK, { signal: controller.signal }, streamKeys)
+                : streamKeys();
+            void streaming.then(() => {
+                if (!hasKey) fail(new Error("The API key stream closed before sending a key"));
+            }, (error: unknown) => {
+                if (!hasKey) fail(error);
+                else if (!controller.signal.aborted) handleAsyncError(error, "Lost the API key stream");
+            }).finally(() => {
+                clearTimeout(timeoutId);
+                channel.close();
+                if (this.apiKeyStream === controller) {
+                    this.apiKeyStream = undefined;
+                    // The key won't be rotated anymore: fetch a new one on the next streaming
+                    this.encryptedApiKey = undefined;
+                    this.apiKey = undefined;
+                }
+            });
+        });
+    }
+
+    private async readAPIKeyStream(
+        signal: AbortSignal, onKey: (data: APIKey) => void
+    ): Promise<void> {
+        const token = await getToken();
+        const response = await fetch(`${import.meta.env.VITE_BACKEND_URL}/api/v1/openrouter/session/stream`, {
+            method: "GET",
+            headers: {
+                Accept: "text/event-stream",
+                Authorization: `Bearer ${token}`,
+            },
+            signal,
+        });
+        if (!response.ok || response.body === null) throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = "";
+        for (; ;) {
+            const { done, value } = await reader.read();
+            if (done) return;
+            buffer += value;
+            let end = buffer.indexOf("\n\n");
+            while (end !== -1) {
+                const lines = buffer.slice(0, end).split("\n");
+                const eventType = lines.find((line) => line.startsWith("event:"))?.slice(6).trim();
+                const data = lines
+                    .filter((line) => line.startsWith("data:"))
+                    .map((line) => line.slice(5).trim())
+                    .join("\n");
+                buffer = buffer.slice(end + 2);
+                // Comments (keep-alive) have no data
+                if (data) {
+                    const payload = JSON.parse(data) as { key?: string, hash?: string, max_age?: unknown, detail?: string };
+                    // The server failed to retrieve a key and closes the stream
+                    if (eventType === "error") throw new Error(payload.detail ?? "Failed to retrieve an API key");
+                    onKey(this.parseAPIKey(payload));
+                }
+                end = buffer.indexOf("\n\n");
+            }
         }
     }
 
     private cleanApiKeys(): void {
-        clearTimeout(this.apiKeyTimeoutId);
+        const apiKeyStream = this.apiKeyStream;
+        this.apiKeyStream = undefined;
+        apiKeyStream?.abort();
         this.apiKey = undefined;
+        // The key is shared with the other tabs: the server removes it when it expires
         this.encryptedApiKey = undefined;
-        this.fetchRemoveAPIKey();
-        this.apiHash = undefined;
     }
 
 }